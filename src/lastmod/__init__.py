@@ -23,4 +23,4 @@ if __name__ == "__main__":
             "Specify cache path and database path by config or command-line args"
         )
     with mgr.urlopen(parsed_args.url) as f:
-        print(f.decode())
+        print(f.read().decode())
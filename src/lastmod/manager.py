@@ -1,20 +1,52 @@
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser, SectionProxy
 from contextlib import contextmanager
+import hashlib
+import io
 import json
 import logging
 import os
 import sqlite3
+import threading
+import time
 import typing
 import urllib.request
-import uuid
+
+from .pool import ConnectionPool
+from .utils import ZIP_FORMATS, open_payload, write_payload
 
 
 NAMESPACE = "lastmod"
+# Records buffered by fetch_many(...) before writing them in one transaction
+INSERT_BATCH_SIZE = 1000
+# Seconds fetch_many(...) may hold buffered records before writing them anyway
+INSERT_FLUSH_INTERVAL = 0.5
+# Bound on "?" parameters per statement (SQLITE_MAX_VARIABLE_NUMBER)
+SELECT_BATCH_SIZE = 500
+# Statements are kept constant so sqlite3's per-connection statement cache reuses them
+SELECT_RESPONSE_SQL = "SELECT url, headers, location FROM response WHERE url = ?"
+INSERT_RESPONSE_SQL = (
+    "INSERT OR REPLACE INTO response (url, headers, location, size, accessed_at)"
+    " VALUES (?, ?, ?, ?, ?)"
+)
+TOUCH_RESPONSE_SQL = "UPDATE response SET accessed_at = ? WHERE url = ?"
+# Accepted values of the journal_mode option
+JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+# Compact separators keep stored header records small
+HEADERS_ENCODER = json.JSONEncoder(separators=(",", ":"))
+# Stored with the response headers to record how the payload file is compressed
+ZIP_FORMAT_HEADER = "x-lastmod-zip-format"
+
+# Cached response record, with headers parsed from JSON
+CachedResponse = namedtuple("CachedResponse", "url headers location")
 
 
 class CacheManager:
     """
     Use as the interface for URL requests
+    May be shared between threads; its database connection is used under a lock
     :param cache_path: parent directory for storing/reading cached payloads
     :param db: path to SQLite3 database for response records
     """
@@ -35,39 +67,137 @@ class CacheManager:
             config = ConfigParser()
             config.read(config_ini)
             section = config[NAMESPACE]
-        return cls(cache_path=section.get("cache_path"), db=section.get("db"))
+        return cls(
+            cache_path=section.get("cache_path"),
+            db=section.get("db"),
+            journal_mode=section.get("journal_mode", "WAL"),
+            use_etags=section.getboolean("use_etags", True),
+            zip_format=section.get("zip_format"),
+            size_limit=section.getfloat("size_limit"),
+        )
 
     def __init__(
         self,
         cache_path: typing.Optional[os.PathLike],
         db: typing.Optional[os.PathLike] = None,
+        journal_mode: typing.Optional[str] = "WAL",
+        use_etags: bool = True,
+        zip_format: typing.Optional[str] = None,
+        size_limit: typing.Optional[float] = None,
     ):
+        """
+        :param journal_mode: SQLite3 journal mode, or None for SQLite's default
+            WAL mode keeps '<db>-wal' and '<db>-shm' files alongside the database
+        :param use_etags: also revalidate with 'If-None-Match' from a cached 'ETag'
+        :param zip_format: compress new payload files ('gzip', 'bz2' or 'lzma')
+        :param size_limit: maximum total size of payload files on disk (in MiB),
+            least recently accessed payloads are evicted beyond it
+        """
         if not cache_path:
             raise ValueError("Must specify cache_path in argument or config")
-        self.cache_path = cache_path
+        if journal_mode and journal_mode.upper() not in JOURNAL_MODES:
+            raise ValueError(f"Unsupported journal_mode: '{journal_mode}'")
+        if zip_format and zip_format not in ZIP_FORMATS:
+            raise ValueError(f"Unsupported zip_format: '{zip_format}'")
+        self.cache_path = os.path.abspath(cache_path)
+        os.makedirs(self.cache_path, exist_ok=True)
         self.db = db
+        self.journal_mode = journal_mode
+        self.use_etags = use_etags
+        self.zip_format = zip_format
+        self.size_limit = size_limit
+        self._cx = None
+        # Serializes use of the connection, which is shared between threads
+        self._db_lock = threading.RLock()
+        self._http = ConnectionPool()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
-    def get_cached_response(self, request: urllib.request.Request) -> dict:
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """
+        Close the database connection, if open, and idle HTTP connections
+        """
+        with getattr(self, "_db_lock", threading.RLock()):
+            cx, self._cx = getattr(self, "_cx", None), None
+            if cx is not None:
+                cx.close()
+        if hasattr(self, "_http"):
+            self._http.close()
+
+    def get_cached_response(
+        self, request: urllib.request.Request
+    ) -> typing.Optional[CachedResponse]:
         """
-        Serialize request URL to a subpath relative to self.cache_path
+        Get the cached record for the request URL
         """
         url = request.get_full_url()
-        cur = self._cx.cursor()
-        cur.execute("SELECT * FROM response WHERE url = ?", (url,))
-        return cur.fetchone()
+        with self._locked_cx() as cx:
+            cur = cx.cursor()
+            cur.row_factory = self.cached_response_factory
+            return cur.execute(SELECT_RESPONSE_SQL, (url,)).fetchone()
+
+    def get_cached_responses(
+        self, urls: typing.Sequence[str]
+    ) -> typing.Dict[str, CachedResponse]:
+        """
+        Get cached records for many URLs, querying SELECT_BATCH_SIZE URLs at a time
+        :return: records keyed by URL, for URLs which have one
+        """
+        with self._locked_cx() as cx:
+            cur = cx.cursor()
+            cur.row_factory = self.cached_response_factory
+            records = {}
+            for i in range(0, len(urls), SELECT_BATCH_SIZE):
+                batch = urls[i : i + SELECT_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+                cur.execute(
+                    "SELECT url, headers, location FROM response"
+                    f" WHERE url IN ({placeholders})",
+                    batch,
+                )
+                records.update((record.url, record) for record in cur)
+            return records
 
     @contextmanager
-    def database_connection(self):
-        try:
-            self._cx = sqlite3.connect(self.db)
-            self.init_db(self._cx)
-            self._cx.row_factory = self.response_dict_factory
-            yield self._cx
-        except Exception:
-            raise
-        finally:
-            self._cx.close()
-            self._cx = None
+    def _locked_cx(self) -> typing.Iterator[sqlite3.Connection]:
+        """
+        Use the database connection while holding the connection lock
+        """
+        with self._db_lock:
+            yield self._get_cx()
+
+    def _get_cx(self) -> sqlite3.Connection:
+        """
+        Get the database connection, connecting and initializing on first use
+        """
+        if self._cx is None:
+            cx = sqlite3.connect(
+                self.db, cached_statements=256, check_same_thread=False
+            )
+            self.init_pragmas(cx, self.journal_mode)
+            self.init_db(cx)
+            self._cx = cx
+        return self._cx
+
+    @staticmethod
+    def init_pragmas(cx, journal_mode: typing.Optional[str] = "WAL"):
+        """
+        Tune the connection for write-heavy use
+        synchronous=NORMAL is only durable under WAL, so it is set only in that mode
+        """
+        pragmas = ["PRAGMA temp_store = MEMORY;", "PRAGMA cache_size = -65536;"]
+        if journal_mode:
+            pragmas.append(f"PRAGMA journal_mode = {journal_mode};")
+            if journal_mode.upper() == "WAL":
+                pragmas.append("PRAGMA synchronous = NORMAL;")
+        cx.executescript("\n".join(pragmas))
 
     @staticmethod
     def init_db(cx):
@@ -77,50 +207,167 @@ class CacheManager:
             CREATE TABLE IF NOT EXISTS response (
                 url TEXT PRIMARY KEY,
                 headers TEXT,
-                location TEXT
+                location TEXT,
+                size INTEGER,
+                accessed_at INTEGER
             )
             """
         )
+        # Databases created before size_limit lack its bookkeeping columns
+        columns = {row[1] for row in cur.execute("PRAGMA table_info(response)")}
+        if "size" not in columns:
+            cur.execute("ALTER TABLE response ADD COLUMN size INTEGER")
+            sizes = [
+                (os.path.getsize(location) if os.path.exists(location) else 0, url)
+                for url, location in cur.execute("SELECT url, location FROM response")
+            ]
+            with cx:
+                cx.executemany("UPDATE response SET size = ? WHERE url = ?", sizes)
+        if "accessed_at" not in columns:
+            cur.execute("ALTER TABLE response ADD COLUMN accessed_at INTEGER")
+            with cx:
+                cx.execute("UPDATE response SET accessed_at = 0")
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_response_accessed_at"
+            " ON response (accessed_at)"
+        )
 
     @staticmethod
-    def response_dict_factory(cursor, row):
+    def cached_response_factory(cursor, row) -> CachedResponse:
         """
-        Convert fetched rows to dict
-        Set connection.row_factory = <this method>
+        Convert fetched (url, headers, location) rows to CachedResponse
+        Set cursor.row_factory = <this method>
         https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.row_factory
         """
-        data = {}
-        for i, col in enumerate(cursor.description):
-            data[col[0]] = row[i]
-        return data
+        return CachedResponse(row[0], json.loads(row[1]) if row[1] else {}, row[2])
 
     def generate_cache_location(self, url: str) -> os.PathLike:
         """
         Create a unique cache location for a URL (absolute path)
         """
-        basename = str(uuid.uuid5(uuid.NAMESPACE_URL, url))
-        return os.path.abspath(os.path.join(self.cache_path, basename))
+        basename = hashlib.blake2b(url.encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.cache_path, basename)
 
     @staticmethod
     def normalize_headers(headers: typing.Dict) -> str:
         """
         Normalization is lower-casing keys, then serialize the result to JSON
         """
-        norm = {}
-        for k, v in headers.items():
-            norm[k.lower()] = v
-        return json.dumps(norm)
+        return HEADERS_ENCODER.encode({k.lower(): v for k, v in headers.items()})
 
     def insert_response(self, url: str, headers: typing.Dict, location: os.PathLike):
         """
         Create record for response
         """
-        headers = self.normalize_headers(headers)
-        self._cx.execute(
-            "INSERT OR REPLACE INTO response VALUES (?, ?, ?)",
-            (url, headers, location),
-        )
-        self._cx.commit()
+        self.insert_responses([(url, headers, location)])
+
+    def insert_responses(
+        self, records: typing.Iterable[typing.Tuple[str, typing.Dict, os.PathLike]]
+    ):
+        """
+        Create records for (url, headers, location) responses in one transaction
+        """
+        now = int(time.time())
+        prepared = [
+            (
+                url,
+                self.normalize_headers(headers),
+                location,
+                os.path.getsize(location),
+                now,
+            )
+            for url, headers, location in records
+        ]
+        with self._locked_cx() as cx:
+            with cx:
+                cx.executemany(INSERT_RESPONSE_SQL, prepared)
+
+    def touch_responses(self, urls: typing.Iterable[str]):
+        """
+        Mark records for :urls: as accessed now, in one transaction
+        """
+        now = int(time.time())
+        with self._locked_cx() as cx:
+            with cx:
+                cx.executemany(TOUCH_RESPONSE_SQL, ((now, url) for url in urls))
+
+    def evict(self):
+        """
+        Delete least recently accessed payloads until the total fits self.size_limit
+        The total is summed from the database, so that writes by other connections
+        count towards it; the write lock is taken first, so that concurrent
+        evictions don't both delete for the same excess
+        """
+        if self.size_limit is None:
+            return
+        with self._locked_cx() as cx:
+            with cx:
+                cx.execute("BEGIN IMMEDIATE")
+                (total,) = cx.execute("SELECT TOTAL(size) FROM response").fetchone()
+                excess = total - self.size_limit * 1024 * 1024
+                if excess <= 0:
+                    return
+                evicted = []
+                rows = cx.execute(
+                    "SELECT url, location, size FROM response ORDER BY accessed_at"
+                )
+                for url, location, size in rows:
+                    evicted.append(url)
+                    try:
+                        os.remove(location)
+                    except FileNotFoundError:
+                        pass
+                    excess -= size or 0
+                    if excess <= 0:
+                        break
+                rows.close()
+                for i in range(0, len(evicted), SELECT_BATCH_SIZE):
+                    batch = evicted[i : i + SELECT_BATCH_SIZE]
+                    placeholders = ", ".join("?" * len(batch))
+                    cx.execute(
+                        f"DELETE FROM response WHERE url IN ({placeholders})", batch
+                    )
+            logging.info(f"Evicted {len(evicted)} cached responses")
+
+    def payload_headers(self, headers: typing.Mapping) -> typing.Dict:
+        """
+        Response headers to record with a payload written by this manager
+        """
+        headers = dict(headers)
+        if self.zip_format:
+            headers[ZIP_FORMAT_HEADER] = self.zip_format
+        return headers
+
+    @staticmethod
+    def open_cached(cached_resp: CachedResponse) -> typing.BinaryIO:
+        """
+        Open the payload file of a cached response record for reading
+        """
+        zip_format = cached_resp.headers.get(ZIP_FORMAT_HEADER)
+        return open_payload(cached_resp.location, "rb", zip_format)
+
+    def prepare_request(
+        self,
+        request: urllib.request.Request,
+        cached_resp: typing.Optional[CachedResponse],
+    ) -> typing.Optional[os.PathLike]:
+        """
+        Add conditional headers to :request: from a cached response record
+        :return: cache location of the record, if any
+        """
+        if not cached_resp:
+            return None
+        cache_dest = cached_resp.location
+        if not os.path.isabs(cache_dest):
+            cache_dest = os.path.abspath(cache_dest)
+        if os.path.exists(cache_dest):
+            last_modified = cached_resp.headers.get("last-modified")
+            if last_modified:
+                request.add_header("If-Modified-Since", last_modified)
+            etag = cached_resp.headers.get("etag")
+            if etag and self.use_etags:
+                request.add_header("If-None-Match", etag)
+        return cache_dest
 
     @contextmanager
     def urlopen(
@@ -129,51 +376,277 @@ class CacheManager:
         data: typing.Any = None,
         timeout: typing.Union[int, float, None] = None,
         **kwargs,
-    ):
+    ) -> typing.Iterator[typing.BinaryIO]:
         """
-        Primary method to make URL request
+        Primary method to make URL request, yielding the payload as a binary file
         Accepts arguments matching urllib.request.urlopen(...)
+        Connections are kept alive and reused for later requests to the same host
+        A 200 payload is streamed to its cache location before it is yielded,
+        a 304 payload is yielded as the open cache file without reading it
         :param url: resource to fetch
-        :param cache_dest: destination to cache payload
-            if not specified, automatically determines location within self.cache_path
         """
         if isinstance(url, urllib.request.Request):
             request = url
         else:
             request = urllib.request.Request(url)
-        with self.database_connection():
-            cached_resp = self.get_cached_response(request)
-            if cached_resp:
-                cache_dest = cached_resp.get("location")
-            if cache_dest:
-                cache_dest = os.path.abspath(cache_dest)
-            if cached_resp and os.path.exists(cache_dest):
-                cached_headers = json.loads(cached_resp["headers"])
-                last_modified = cached_headers.get("last-modified")
-                if last_modified:
-                    request.add_header("If-Modified-Since", last_modified)
+        cached_resp = self.get_cached_response(request)
+        cache_dest = self.prepare_request(request, cached_resp)
+        try:
+            resp = self._http.urlopen(request, data, timeout, **kwargs)
+        except urllib.error.HTTPError as err:
+            logging.warning(f"Error {err.status}: {err.url}")
+            if err.status == 304 and cache_dest:
+                self.touch_responses([request.full_url])
+                with self.open_cached(cached_resp) as f:
+                    yield f
+                return
+            raise
+        with resp:
+            logging.info(f"Request {resp.status}: {resp.url}")
+            if resp.status != 200:
+                yield resp
+                return
+            cache_dest = cache_dest or self.generate_cache_location(request.full_url)
+            write_payload(resp, cache_dest, self.zip_format)
+            headers = self.payload_headers(resp.headers)
+            self.insert_responses([(request.full_url, headers, cache_dest)])
+        try:
+            with open_payload(cache_dest, "rb", self.zip_format) as f:
+                yield f
+        finally:
+            self.evict()
+
+    # Alias of urlopen(...)
+    stream = urlopen
+
+    def read_cached(self, url: typing.Union[str, urllib.request.Request]) -> bytes:
+        """
+        Read the cached payload for :url: without making a request
+        :raises FileNotFoundError: if :url: has no cached payload
+        """
+        if isinstance(url, urllib.request.Request):
+            url = url.full_url
+        cached_resp = self.get_cached_response(urllib.request.Request(url))
+        if not cached_resp:
+            raise FileNotFoundError(f"No cached payload for: '{url}'")
+        return self.read_payload(cached_resp)
+
+    def read_payload(self, cached_resp: CachedResponse) -> bytes:
+        """
+        Read the payload file of a cached response record
+        """
+        with self.open_cached(cached_resp) as f:
+            return f.read()
+
+    def write_payload_bytes(self, body: bytes, cache_dest: os.PathLike) -> None:
+        """
+        Write a payload held in memory to its cache location
+        """
+        write_payload(io.BytesIO(body), cache_dest, self.zip_format)
+
+    async def fetch_many(
+        self,
+        urls: typing.Iterable[typing.Union[str, urllib.request.Request]],
+        concurrency: int = 100,
+        write_concurrency: int = 8,
+        timeout: typing.Union[int, float, None] = None,
+    ) -> typing.List[typing.Union[bytes, None, BaseException]]:
+        """
+        Fetch many URLs concurrently
+        Runs as a pipeline of stages connected by queues, so that receiving,
+        writing and recording payloads overlap:
+            :concurrency: fetchers -> :write_concurrency: writers -> a DB batcher
+        Blocking HTTP and file I/O run in a thread pool
+        :param timeout: per-request timeout in seconds, as for urlopen(...)
+        :return: payloads in the order of :urls:
+            None for non-200 success statuses, or the exception raised for that URL
+        """
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+        if write_concurrency < 1:
+            raise ValueError(
+                f"write_concurrency must be at least 1, got {write_concurrency}"
+            )
+        requests = [
+            urllib.request.Request(url) if isinstance(url, str) else url for url in urls
+        ]
+        if not requests:
+            return []
+        cached_resps = self.get_cached_responses(
+            list({request.full_url for request in requests})
+        )
+        results = [None] * len(requests)
+        accessed = []
+        fetch_q = asyncio.Queue()
+        for item in enumerate(requests):
+            fetch_q.put_nowait(item)
+        write_q = asyncio.Queue(concurrency)
+        db_q = asyncio.Queue()
+        workers = concurrency + write_concurrency
+        # Not a with-block: its shutdown(wait=True) would block the event loop on
+        # cancellation until every in-flight request returns
+        executor = ThreadPoolExecutor(max_workers=workers)
+        writers = [
+            asyncio.ensure_future(self._write_stage(write_q, db_q, results, executor))
+            for _ in range(write_concurrency)
+        ]
+        batcher = asyncio.ensure_future(self._db_stage(db_q))
+        try:
+            await asyncio.gather(
+                *(
+                    self._fetch_stage(
+                        fetch_q,
+                        write_q,
+                        cached_resps,
+                        results,
+                        accessed,
+                        executor,
+                        timeout,
+                    )
+                    for _ in range(min(concurrency, len(requests)))
+                )
+            )
+            for _ in writers:
+                await write_q.put(None)
+            await asyncio.gather(*writers)
+            await db_q.put(None)
+            await batcher
+        finally:
+            for task in writers + [batcher]:
+                task.cancel()
+            executor.shutdown(wait=False)
+            self.touch_responses(accessed)
+            self.evict()
+        return results
+
+    async def _fetch_stage(
+        self,
+        fetch_q: asyncio.Queue,
+        write_q: asyncio.Queue,
+        cached_resps: typing.Dict[str, CachedResponse],
+        results: typing.List,
+        accessed: typing.List[str],
+        executor: ThreadPoolExecutor,
+        timeout: typing.Union[int, float, None],
+    ):
+        """
+        Pipeline stage of fetch_many(...): fetch (index, request) items
+        until :fetch_q: is empty, queueing 200 payloads on :write_q:
+        """
+        while True:
             try:
-                resp = urllib.request.urlopen(request, data, timeout, **kwargs)
-                logging.info(f"Request {resp.status}: {resp.url}")
-                if resp.status == 200:
-                    body = resp.read()
-                    try:
-                        yield body
-                    finally:
-                        cache_dest = cache_dest or self.generate_cache_location(
-                            request.full_url
-                        )
-                        self.insert_response(request.full_url, resp.headers, cache_dest)
-                        with open(cache_dest, "wb") as f:
-                            f.write(body)
-            except urllib.error.HTTPError as err:
-                logging.warning(f"Error {err.status}: {err.url}")
-                if err.status == 304 and cache_dest:
-                    with open(cache_dest, "rb") as f:
-                        body = f.read()
-                        yield body
+                i, request = fetch_q.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                results[i], record = await self._fetch(
+                    request,
+                    cached_resps.get(request.full_url),
+                    accessed,
+                    executor,
+                    timeout,
+                )
+            except Exception as exc:
+                results[i] = exc
+                continue
+            if record:
+                await write_q.put((i, results[i], record))
+
+    async def _fetch(
+        self,
+        request: urllib.request.Request,
+        cached_resp: typing.Optional[CachedResponse],
+        accessed: typing.List[str],
+        executor: ThreadPoolExecutor,
+        timeout: typing.Union[int, float, None],
+    ) -> typing.Tuple[
+        typing.Optional[bytes],
+        typing.Optional[typing.Tuple[str, typing.Dict, os.PathLike]],
+    ]:
+        """
+        Fetch a single request for fetch_many(...)
+        :param cached_resp: record from get_cached_responses(...), if any
+        :param accessed: buffer of URLs answered from the cache
+        :return: payload, and for a 200 the (url, headers, location) record to write
+        """
+        loop = asyncio.get_event_loop()
+        cache_dest = self.prepare_request(request, cached_resp)
+        try:
+            resp = await loop.run_in_executor(
+                executor, self._http.urlopen, request, None, timeout
+            )
+            with resp:
+                body = await loop.run_in_executor(executor, resp.read)
+        except urllib.error.HTTPError as err:
+            logging.warning(f"Error {err.status}: {err.url}")
+            if err.status == 304 and cache_dest:
+                accessed.append(request.full_url)
+                body = await loop.run_in_executor(
+                    executor, self.read_payload, cached_resp
+                )
+                return body, None
+            raise
+        logging.info(f"Request {resp.status}: {resp.url}")
+        if resp.status != 200:
+            return None, None
+        cache_dest = cache_dest or self.generate_cache_location(request.full_url)
+        return body, (request.full_url, self.payload_headers(resp.headers), cache_dest)
+
+    async def _write_stage(
+        self,
+        write_q: asyncio.Queue,
+        db_q: asyncio.Queue,
+        results: typing.List,
+        executor: ThreadPoolExecutor,
+    ):
+        """
+        Pipeline stage of fetch_many(...): write (index, payload, record) items
+        from :write_q: to disk, passing records on to :db_q: until None arrives
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            item = await write_q.get()
+            if item is None:
+                return
+            i, body, record = item
+            try:
+                await loop.run_in_executor(
+                    executor, self.write_payload_bytes, body, record[2]
+                )
+            except Exception as exc:
+                results[i] = exc
+                continue
+            await db_q.put(record)
+
+    async def _db_stage(self, db_q: asyncio.Queue):
+        """
+        Pipeline stage of fetch_many(...): insert records from :db_q: in one
+        transaction per INSERT_BATCH_SIZE records or INSERT_FLUSH_INTERVAL seconds,
+        until None arrives
+        """
+        loop = asyncio.get_event_loop()
+        records = []
+        deadline = loop.time() + INSERT_FLUSH_INTERVAL
+        try:
+            while True:
+                timeout = max(deadline - loop.time(), 0)
+                try:
+                    record = await asyncio.wait_for(db_q.get(), timeout)
+                except asyncio.TimeoutError:
+                    pass
                 else:
-                    raise
+                    if record is None:
+                        return
+                    records.append(record)
+                    if len(records) < INSERT_BATCH_SIZE and loop.time() < deadline:
+                        continue
+                if records:
+                    self.insert_responses(records)
+                    records.clear()
+                deadline = loop.time() + INSERT_FLUSH_INTERVAL
+        finally:
+            if records:
+                self.insert_responses(records)
 
 
 if __name__ == "__main__":
@@ -197,4 +670,4 @@ if __name__ == "__main__":
             "Specify cache path and database path by config or command-line args"
         )
     with mgr.urlopen(parsed_args.url) as f:
-        print(f.decode())
+        print(f.read().decode())
@@ -0,0 +1,209 @@
+import functools
+import http.client
+import io
+import queue
+import sys
+import threading
+import typing
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+# Followed by ConnectionPool.urlopen(...), as by urllib.request.HTTPRedirectHandler
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+USER_AGENT = f"Python-urllib/{sys.version_info[0]}.{sys.version_info[1]}"
+
+
+class PooledResponse(http.client.HTTPResponse):
+    """
+    Response which hands its connection back to the pool when closed
+    """
+
+    release: typing.Optional[typing.Callable[[bool], None]] = None
+
+    def close(self):
+        # fp is released by http.client once the payload has been read to the end
+        complete = self.fp is None
+        super().close()
+        release, self.release = self.release, None
+        if release is not None:
+            release(complete)
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections, reused across requests to the same host
+    urllib.request.urlopen(...) opens (and closes) a new connection per request
+    :param maxsize: maximum idle connections kept per host
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _idle_connections(self, key: typing.Tuple[str, str]) -> queue.LifoQueue:
+        with self._lock:
+            if key not in self._idle:
+                self._idle[key] = queue.LifoQueue(self.maxsize)
+            return self._idle[key]
+
+    def _get_connection(
+        self,
+        key: typing.Tuple[str, str],
+        timeout: typing.Optional[float],
+        reuse: bool = True,
+    ) -> typing.Tuple[http.client.HTTPConnection, bool]:
+        """
+        :return: idle connection for (scheme, host) or a new one, whether it's reused
+        """
+        try:
+            if not reuse:
+                raise queue.Empty
+            conn = self._idle_connections(key).get_nowait()
+        except queue.Empty:
+            scheme, host = key
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(host, timeout=timeout)
+            else:
+                conn = http.client.HTTPConnection(host, timeout=timeout)
+            conn.response_class = PooledResponse
+            return conn, False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _release(
+        self,
+        key: typing.Tuple[str, str],
+        conn: http.client.HTTPConnection,
+        complete: bool,
+    ):
+        """
+        Keep :conn: for reuse if its last response was read completely
+        """
+        if complete:
+            try:
+                self._idle_connections(key).put_nowait(conn)
+                return
+            except queue.Full:
+                pass
+        conn.close()
+
+    def close(self):
+        """
+        Close all idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            while True:
+                try:
+                    connections.get_nowait().close()
+                except queue.Empty:
+                    break
+
+    def urlopen(
+        self,
+        url: typing.Union[str, urllib.request.Request],
+        data: typing.Any = None,
+        timeout: typing.Union[int, float, None] = None,
+        **kwargs,
+    ):
+        """
+        Replacement for urllib.request.urlopen(...) over pooled connections
+        Falls back to urllib for other schemes, proxied hosts or extra arguments
+        :raises urllib.error.HTTPError: on a final status other than 2xx, like urllib
+        """
+        if isinstance(url, urllib.request.Request):
+            request = url
+        else:
+            request = urllib.request.Request(url)
+        if data is not None:
+            request.data = data
+        if kwargs or request.type not in ("http", "https") or self._proxied(request):
+            return urllib.request.urlopen(request, timeout=timeout, **kwargs)
+        for _ in range(MAX_REDIRECTS + 1):
+            resp = self._send(request, timeout)
+            location = resp.getheader("Location")
+            if resp.status not in REDIRECT_STATUSES or not location:
+                break
+            resp.read()
+            resp.close()
+            location = urllib.parse.urljoin(request.full_url, location)
+            request = self._redirect_request(request, resp.status, location)
+        if 200 <= resp.status < 300:
+            resp.url = request.full_url
+            return resp
+        body = resp.read()
+        resp.close()
+        raise urllib.error.HTTPError(
+            request.full_url, resp.status, resp.reason, resp.msg, io.BytesIO(body)
+        )
+
+    @staticmethod
+    def _proxied(request: urllib.request.Request) -> bool:
+        proxies = urllib.request.getproxies()
+        return request.type in proxies and not urllib.request.proxy_bypass(request.host)
+
+    @staticmethod
+    def _redirect_request(
+        request: urllib.request.Request, status: int, location: str
+    ) -> urllib.request.Request:
+        """
+        Request for a redirect :location:, following urllib's rules
+        307/308 repeat the request, others become a GET (or HEAD) without body
+        """
+        if status in (307, 308):
+            return urllib.request.Request(
+                location,
+                data=request.data,
+                headers=request.headers,
+                method=request.get_method(),
+            )
+        headers = {
+            k: v
+            for k, v in request.headers.items()
+            if k.lower() not in ("content-length", "content-type")
+        }
+        method = "HEAD" if request.get_method() == "HEAD" else "GET"
+        return urllib.request.Request(location, headers=headers, method=method)
+
+    def _send(
+        self,
+        request: urllib.request.Request,
+        timeout: typing.Optional[float],
+        reuse: bool = True,
+    ) -> PooledResponse:
+        """
+        Send :request: and read the response status and headers
+        A reused connection the server has since closed is retried once on a
+        new connection, for GET and HEAD requests
+        """
+        key = (request.type, request.host)
+        conn, reused = self._get_connection(key, timeout, reuse)
+        headers = dict(request.header_items())
+        headers.setdefault("User-agent", USER_AGENT)
+        if request.data is not None:
+            headers.setdefault("Content-type", "application/x-www-form-urlencoded")
+        method = request.get_method()
+        try:
+            conn.request(method, request.selector, request.data, headers)
+            resp = conn.getresponse()
+        except ConnectionError as err:
+            conn.close()
+            if reused and method in ("GET", "HEAD"):
+                return self._send(request, timeout, reuse=False)
+            raise urllib.error.URLError(err)
+        except OSError as err:
+            conn.close()
+            raise urllib.error.URLError(err)
+        except http.client.HTTPException:
+            # Malformed responses propagate as from urllib, but free the socket
+            conn.close()
+            raise
+        resp.release = functools.partial(self._release, key, conn)
+        return resp
@@ -1,30 +1,64 @@
+import bz2
 from datetime import datetime, timezone
 import email.utils
+import functools
+import gzip
 from http.client import HTTPResponse
+import lzma
 import os
+import shutil
+import threading
+import time
 import typing
 import urllib.request
 
 
+# Chunk size for streaming payloads to disk
+COPY_BUFSIZE = 1024 * 1024
+
+
+def _open_lzma(path: os.PathLike, mode: str = "rb") -> lzma.LZMAFile:
+    """
+    lzma.open(...) at preset 1 for writing; it rejects a preset for reading
+    """
+    return lzma.open(path, mode, preset=None if "r" in mode else 1)
+
+
+# Supported compression formats for cached payloads
+# Write at fast levels rather than each module's slower default:
+# gzip at zlib's default of 6 (not 9), bz2 at 1 (not 9), lzma at preset 1 (not 6)
+ZIP_FORMATS = {
+    "gzip": functools.partial(gzip.open, compresslevel=6),
+    "bz2": functools.partial(bz2.open, compresslevel=1),
+    "lzma": _open_lzma,
+}
+
+
 def get_last_modified(path: os.PathLike) -> typing.Union[datetime, None]:
     """
     Get last modified timestamp of file in UTC
+    :raises FileNotFoundError: if path doesn't exist
     :raises PermissionError: on insufficient privileges on path
+        (lack of write access surfaces when the file is rewritten)
     """
-    if not os.path.exists(path):
-        raise FileNotFoundError
-    if not os.access(path, os.W_OK):
-        raise PermissionError(f"Insufficient privileges to access: '{path}'")
     stat = os.stat(path)
-    cache_mdt = datetime.fromtimestamp(stat.st_mtime)
-    return cache_mdt.astimezone(timezone.utc)
+    return datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+
+
+def _mtime_epoch(path: os.PathLike) -> int:
+    """
+    Get last modified time of file in whole seconds since the epoch
+    """
+    return os.stat(path).st_mtime_ns // 1_000_000_000
 
 
-def serialize_last_modified(timestamp: datetime) -> str:
+def serialize_last_modified(timestamp: typing.Union[datetime, int]) -> str:
     """
-    Format timezone-aware datetime for 'If-Modified-Since' header
+    Format timezone-aware datetime or epoch seconds for 'If-Modified-Since' header
     """
-    return email.utils.format_datetime(timestamp, usegmt=True)
+    if isinstance(timestamp, datetime):
+        return email.utils.format_datetime(timestamp, usegmt=True)
+    return email.utils.formatdate(timestamp, usegmt=True)
 
 
 def parse_last_modified(last_mod: str) -> datetime:
@@ -34,14 +68,58 @@ def parse_last_modified(last_mod: str) -> datetime:
     return email.utils.parsedate_to_datetime(last_mod)
 
 
-def mark_last_modified(path: os.PathLike, mod_dt: datetime) -> None:
+def _parse_last_modified_epoch(last_mod: str) -> int:
     """
-    Mark :path: file with modified time :mod_dt: (as system local time)
+    Like parse_last_modified(...), as epoch seconds without building a datetime
     """
-    stat = os.stat(path)
+    return email.utils.mktime_tz(email.utils.parsedate_tz(last_mod))
+
+
+def mark_last_modified(
+    path: os.PathLike, mod_time: typing.Union[datetime, int]
+) -> None:
+    """
+    Mark :path: file with modified time :mod_time: (datetime or epoch seconds)
+    Access time is set to now, as :path: has just been written
+    """
+    if isinstance(mod_time, datetime):
+        mod_time = mod_time.timestamp()
     # Last-Modified header doesn't utilize ms - yet
-    set_mtime = int(mod_dt.astimezone().timestamp())
-    os.utime(path, (stat.st_atime, set_mtime))
+    set_mtime_ns = int(mod_time) * 1_000_000_000
+    os.utime(path, ns=(time.time_ns(), set_mtime_ns))
+
+
+def open_payload(
+    path: os.PathLike, mode: str = "rb", zip_format: typing.Optional[str] = None
+) -> typing.BinaryIO:
+    """
+    Open a cached payload file, (de)compressing with :zip_format: if set
+    :param zip_format: one of ZIP_FORMATS
+    """
+    if zip_format:
+        return ZIP_FORMATS[zip_format](path, mode)
+    return open(path, mode)
+
+
+def write_payload(
+    src: typing.BinaryIO, path: os.PathLike, zip_format: typing.Optional[str] = None
+) -> None:
+    """
+    Stream :src: to :path: in COPY_BUFSIZE chunks
+    Writes to a temporary sibling file first, so a failed transfer leaves
+    any previous payload at :path: intact; the temporary name is unique per
+    process and thread, so concurrent writes of one payload don't interleave
+    :param zip_format: compress the payload with one of ZIP_FORMATS
+    """
+    part_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        with open_payload(part_path, "wb", zip_format) as f:
+            shutil.copyfileobj(src, f, COPY_BUFSIZE)
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
 
 
 def urlopen(
@@ -49,41 +127,40 @@ def urlopen(
     url: typing.Union[str, urllib.request.Request],
     *args,
     **kwargs,
-) -> typing.Tuple[HTTPResponse, bytes]:
+) -> typing.Tuple[HTTPResponse, typing.Optional[os.PathLike]]:
     """
     Wrapper for urllib.request.urlopen(...)
     :param cache_path: path to filename for cached file including basename
-    :return: {http.client.HTTPResponse,urllib.error.HTTPError}, {payload,None}
-        payload - HTTPResponse.read() if 200
+    :return: {http.client.HTTPResponse,urllib.error.HTTPError}, {cache_path,None}
+        cache_path - if 200 (payload streamed to it) or 304 (payload cached)
     """
     if isinstance(url, urllib.request.Request):
         request = url
     else:
         request = urllib.request.Request(url)
     try:
-        last_mod = get_last_modified(cache_path)
-        last_mod_str: str = serialize_last_modified(last_mod)
+        last_mod_str: str = serialize_last_modified(_mtime_epoch(cache_path))
         request.add_header("If-Modified-Since", last_mod_str)
     except FileNotFoundError:
         pass
     try:
         response = urllib.request.urlopen(request, *args, **kwargs)
         if response.status == 200:
-            new_last_mod = parse_last_modified(response.headers.get("Last-Modified"))
-            body = response.read()
+            new_last_mod = _parse_last_modified_epoch(
+                response.headers.get("Last-Modified")
+            )
             cache_dirname = os.path.dirname(cache_path)
             if not os.path.isdir(cache_dirname):
                 os.mkdir(cache_dirname)
-            with open(cache_path, "wb") as f:
-                f.write(body)
+            write_payload(response, cache_path)
             mark_last_modified(cache_path, new_last_mod)
+            payload_path = cache_path
         else:
-            body = None
+            payload_path = None
     except urllib.error.HTTPError as err:
         response = err
         if err.status == 304:
-            with open(cache_path, "rb") as f:
-                body = f.read()
+            payload_path = cache_path
         else:
             raise
-    return response, body
+    return response, payload_path
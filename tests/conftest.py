@@ -0,0 +1,59 @@
+import http.server
+import threading
+
+import pytest
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Keep-alive test server
+    /payload/<name> - 200 with body <name> and ETag "<name>", 304 if it matches
+    /redirect - 302 to /payload/target
+    /garbage - malformed status line
+    anything else - 404
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.connections.append(self.connection)
+        self.server.requests.append((self.path, self.client_address, self.headers))
+        if self.path == "/redirect":
+            self.respond(302, b"", Location="/payload/target")
+        elif self.path == "/garbage":
+            self.wfile.write(b"garbage\r\n\r\n")
+        elif self.path.startswith("/payload/"):
+            name = self.path[len("/payload/") :]
+            etag = f'"{name}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.respond(304, None, ETag=etag)
+            else:
+                self.respond(200, name.encode(), ETag=etag)
+        else:
+            self.respond(404, b"not found")
+
+    def respond(self, status, body, **headers):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        if body is not None:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.connections = []
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
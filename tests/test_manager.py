@@ -0,0 +1,215 @@
+import asyncio
+import errno
+import os
+import sqlite3
+import urllib.error
+
+import pytest
+
+from lastmod import CacheManager
+
+
+@pytest.fixture
+def mgr(tmp_path):
+    with CacheManager(tmp_path / "cache", tmp_path / "cache.db") as mgr:
+        yield mgr
+
+
+def stored_urls(mgr):
+    with mgr._locked_cx() as cx:
+        return {url for (url,) in cx.execute("SELECT url FROM response")}
+
+
+def test_fetch_many(http_server, mgr):
+    a, b, c = (f"{http_server.url}/payload/{name}" for name in "abc")
+    missing = f"{http_server.url}/missing"
+
+    results = asyncio.run(mgr.fetch_many([a, b, a, missing], concurrency=2))
+    assert results[:3] == [b"a", b"b", b"a"]
+    assert isinstance(results[3], urllib.error.HTTPError)
+    assert results[3].status == 404
+    assert stored_urls(mgr) == {a, b}
+
+    # a and b revalidate (304, served from the cache), c is new (200)
+    results = asyncio.run(mgr.fetch_many([c, a, missing, b], concurrency=2))
+    assert results[0] == b"c"
+    assert results[1] == b"a"
+    assert isinstance(results[2], urllib.error.HTTPError)
+    assert results[3] == b"b"
+    assert stored_urls(mgr) == {a, b, c}
+    revalidated = {
+        path: headers.get("If-None-Match")
+        for path, _, headers in http_server.requests[-4:]
+    }
+    assert revalidated["/payload/a"] == '"a"'
+    assert revalidated["/payload/b"] == '"b"'
+    assert mgr.read_cached(c) == b"c"
+
+
+def test_fetch_many_failed_write(http_server, mgr, monkeypatch):
+    a, b = (f"{http_server.url}/payload/{name}" for name in "ab")
+    write_payload_bytes = mgr.write_payload_bytes
+
+    def write_except_b(body, cache_dest):
+        if cache_dest == mgr.generate_cache_location(b):
+            raise OSError(errno.ENOSPC, "No space left on device")
+        write_payload_bytes(body, cache_dest)
+
+    monkeypatch.setattr(mgr, "write_payload_bytes", write_except_b)
+    results = asyncio.run(mgr.fetch_many([a, b]))
+    assert results[0] == b"a"
+    assert isinstance(results[1], OSError)
+    assert results[1].errno == errno.ENOSPC
+    assert stored_urls(mgr) == {a}
+
+
+@pytest.mark.parametrize("stages", [{"concurrency": 0}, {"write_concurrency": 0}])
+def test_fetch_many_rejects_empty_stages(mgr, stages):
+    with pytest.raises(ValueError):
+        asyncio.run(mgr.fetch_many(["http://test/a"], **stages))
+
+
+def test_rejects_unknown_journal_mode(tmp_path):
+    with pytest.raises(ValueError):
+        CacheManager(tmp_path / "cache", tmp_path / "cache.db", journal_mode="WAL; --")
+
+
+def write_payloads(mgr, sizes):
+    """
+    Cache payloads of the given sizes under URLs 'http://test/<n>'
+    :return: the URLs
+    """
+    urls = [f"http://test/{n}" for n in range(len(sizes))]
+    for url, size in zip(urls, sizes):
+        location = mgr.generate_cache_location(url)
+        mgr.write_payload_bytes(b"x" * size, location)
+        mgr.insert_responses([(url, {}, location)])
+    return urls
+
+
+def set_accessed_at(mgr, accessed_at):
+    with mgr._locked_cx() as cx:
+        with cx:
+            cx.executemany(
+                "UPDATE response SET accessed_at = ? WHERE url = ?",
+                ((at, url) for url, at in accessed_at.items()),
+            )
+
+
+def test_evict_least_recently_accessed(mgr):
+    a, b, c = write_payloads(mgr, [100, 100, 100])
+    set_accessed_at(mgr, {a: 3, b: 1, c: 2})
+    mgr.evict()
+    assert stored_urls(mgr) == {a, b, c}
+
+    mgr.size_limit = 150 / (1024 * 1024)
+    mgr.evict()
+    assert stored_urls(mgr) == {a}
+    assert not os.path.exists(mgr.generate_cache_location(b))
+    assert not os.path.exists(mgr.generate_cache_location(c))
+    assert mgr.read_cached(a) == b"x" * 100
+
+
+def test_evict_counts_other_connections(tmp_path):
+    size_limit = 250 / (1024 * 1024)
+    with CacheManager(
+        tmp_path / "cache", tmp_path / "cache.db", size_limit=size_limit
+    ) as mgr1, CacheManager(
+        tmp_path / "cache", tmp_path / "cache.db", size_limit=size_limit
+    ) as mgr2:
+        (a,) = write_payloads(mgr1, [100])
+        mgr1.evict()
+        url = "http://test/other"
+        location = mgr2.generate_cache_location(url)
+        mgr2.write_payload_bytes(b"x" * 200, location)
+        mgr2.insert_responses([(url, {}, location)])
+        set_accessed_at(mgr2, {a: 1, url: 2})
+        mgr1.evict()
+        assert stored_urls(mgr2) == {url}
+
+
+def test_revalidation_refreshes_accessed_at(http_server, mgr):
+    a, b = (f"{http_server.url}/payload/{name}" for name in "ab")
+    asyncio.run(mgr.fetch_many([a, b]))
+    set_accessed_at(mgr, {a: 0, b: 0})
+
+    with mgr.urlopen(a) as f:
+        assert f.read() == b"a"
+    asyncio.run(mgr.fetch_many([b]))
+    assert http_server.requests[-1][2].get("If-None-Match") == '"b"'
+    with mgr._locked_cx() as cx:
+        rows = dict(cx.execute("SELECT url, accessed_at FROM response"))
+    assert rows[a] > 0
+    assert rows[b] > 0
+
+
+def test_upgrade_backfills_size(tmp_path):
+    cache_path = tmp_path / "cache"
+    cache_path.mkdir()
+    present, missing = cache_path / "present", cache_path / "missing"
+    present.write_bytes(b"x" * 100)
+    db = tmp_path / "cache.db"
+    cx = sqlite3.connect(db)
+    with cx:
+        cx.execute(
+            "CREATE TABLE response (url TEXT PRIMARY KEY, headers TEXT, location TEXT)"
+        )
+        cx.executemany(
+            "INSERT INTO response VALUES (?, ?, ?)",
+            [
+                ("http://test/present", "{}", str(present)),
+                ("http://test/missing", "{}", str(missing)),
+            ],
+        )
+    cx.close()
+
+    with CacheManager(cache_path, db) as mgr:
+        with mgr._locked_cx() as cx:
+            rows = {
+                url: (size, accessed_at)
+                for url, size, accessed_at in cx.execute(
+                    "SELECT url, size, accessed_at FROM response"
+                )
+            }
+        assert rows == {"http://test/present": (100, 0), "http://test/missing": (0, 0)}
+        assert mgr.read_cached("http://test/present") == b"x" * 100
+
+
+def test_insert_response_commits(tmp_path):
+    payload = tmp_path / "payload"
+    payload.write_bytes(b"x")
+    with CacheManager(tmp_path / "cache", tmp_path / "cache.db") as mgr1:
+        mgr1.insert_response("http://test/a", {}, str(payload))
+        # A transaction left open by mgr1 would hold the write lock
+        with CacheManager(tmp_path / "cache", tmp_path / "cache.db") as mgr2:
+            mgr2.insert_response("http://test/b", {}, str(payload))
+    with CacheManager(tmp_path / "cache", tmp_path / "cache.db") as mgr:
+        assert stored_urls(mgr) == {"http://test/a", "http://test/b"}
+
+
+@pytest.mark.parametrize("zip_format", ["gzip", "bz2", "lzma"])
+def test_zip_format(http_server, tmp_path, zip_format):
+    a, b, c = (f"{http_server.url}/payload/{name}" for name in "abc")
+    with CacheManager(tmp_path / "plain", tmp_path / "cache.db") as mgr:
+        asyncio.run(mgr.fetch_many([b]))
+
+    with CacheManager(
+        tmp_path / "cache", tmp_path / "cache.db", zip_format=zip_format
+    ) as mgr:
+        with mgr.urlopen(a) as f:
+            assert f.read() == b"a"
+        with open(mgr.generate_cache_location(a), "rb") as f:
+            assert f.read() != b"a"
+        # 304s are read through the format each payload was cached with
+        with mgr.urlopen(a) as f:
+            assert f.read() == b"a"
+        with mgr.urlopen(b) as f:
+            assert f.read() == b"b"
+        assert http_server.requests[-1][2].get("If-None-Match") == '"b"'
+        assert mgr.read_cached(a) == b"a"
+        assert asyncio.run(mgr.fetch_many([a, b, c])) == [b"a", b"b", b"c"]
+        assert mgr.read_cached(c) == b"c"
+
+    with CacheManager(tmp_path / "cache", tmp_path / "cache.db") as mgr:
+        assert mgr.read_cached(a) == b"a"
+        assert asyncio.run(mgr.fetch_many([a, b, c])) == [b"a", b"b", b"c"]
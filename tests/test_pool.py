@@ -0,0 +1,81 @@
+import http.client
+import socket
+import urllib.error
+import urllib.request
+
+import pytest
+
+from lastmod.pool import ConnectionPool
+
+
+@pytest.fixture
+def pool():
+    pool = ConnectionPool()
+    yield pool
+    pool.close()
+
+
+def client_ports(server):
+    return [client_address[1] for _, client_address, _ in server.requests]
+
+
+def test_reuses_keep_alive_connection(http_server, pool):
+    for _ in range(3):
+        with pool.urlopen(f"{http_server.url}/payload/a") as resp:
+            assert resp.status == 200
+            assert resp.read() == b"a"
+    assert len(set(client_ports(http_server))) == 1
+
+
+def test_not_modified_raises_http_error(http_server, pool):
+    request = urllib.request.Request(
+        f"{http_server.url}/payload/a", headers={"If-None-Match": '"a"'}
+    )
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        pool.urlopen(request)
+    assert excinfo.value.status == 304
+    assert excinfo.value.url == f"{http_server.url}/payload/a"
+    # The connection is still reusable after the error response
+    with pool.urlopen(f"{http_server.url}/payload/b") as resp:
+        assert resp.read() == b"b"
+    assert len(set(client_ports(http_server))) == 1
+
+
+def test_error_status_raises_http_error(http_server, pool):
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        pool.urlopen(f"{http_server.url}/missing")
+    assert excinfo.value.status == 404
+    assert excinfo.value.read() == b"not found"
+
+
+def test_follows_redirect(http_server, pool):
+    with pool.urlopen(f"{http_server.url}/redirect") as resp:
+        assert resp.status == 200
+        assert resp.url == f"{http_server.url}/payload/target"
+        assert resp.read() == b"target"
+
+
+def test_retries_stale_connection(http_server, pool):
+    with pool.urlopen(f"{http_server.url}/payload/a") as resp:
+        resp.read()
+    # Server drops the idle keep-alive connection
+    for connection in http_server.connections:
+        connection.shutdown(socket.SHUT_RDWR)
+    with pool.urlopen(f"{http_server.url}/payload/b") as resp:
+        assert resp.read() == b"b"
+    assert len(set(client_ports(http_server))) == 2
+
+
+def test_malformed_response_closes_connection(http_server, pool, monkeypatch):
+    closed = []
+    close = http.client.HTTPConnection.close
+
+    def track_close(conn):
+        closed.append(conn)
+        close(conn)
+
+    monkeypatch.setattr(http.client.HTTPConnection, "close", track_close)
+    with pytest.raises(http.client.BadStatusLine):
+        pool.urlopen(f"{http_server.url}/garbage")
+    assert closed
+    assert not any(idle.qsize() for idle in pool._idle.values())